@@ -1,22 +1,34 @@
 # app.py
 import os
-import json
+import re
+import inspect
+import orjson
 import uuid
 import boto3
+from botocore.config import Config as BotocoreConfig
+import redis
+import msgpack
 import logging
-from flask import Flask, request, jsonify
+from dataclasses import dataclass, field, fields, asdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import Flask, request
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import raiseload
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from database import setup_database, Session, Customer, EMI, OTP, UnresolvedChat, ClientInteraction, RAGDocument
-from utils import generate_otp_code, send_sms_otp, verify_otp_code, extract_digits_from_speech, hide_number
-from taskrouter_setup import setup as taskrouter_config_setup, build_client as build_twilio_client, WorkspaceInfo
+from logging_setup import configure_logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+# Configure logging before the imports below, whose module-level setup already logs
+configure_logging()
 logger = logging.getLogger(__name__)
 
+from database import setup_database, db_session, Session, Customer, CustomerAccount, Loan, EMI, OTP, UnresolvedChat, ClientInteraction, RAGDocument
+from utils import generate_otp_code, send_sms_otp, verify_otp_code, extract_digits_from_speech, hide_number
+from taskrouter_setup import setup as taskrouter_config_setup, build_client as build_twilio_client, WorkspaceInfo
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -31,8 +43,10 @@ AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION_NAME = os.getenv("AWS_REGION_NAME")
 CLAUDE_MODEL_ID = os.getenv("CLAUDE_MODEL_ID")
-CLAUDE_INTENT_MODEL_ID = os.getenv("CLAUDE_INTENT_MODEL_ID")
+CLAUDE_INTENT_MODEL_ID = os.getenv("CLAUDE_INTENT_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0") # Small, fast model is enough for 3-way intent routing
 ALICE_NUMBER = os.getenv("ALICE_NUMBER") # Used for TaskRouter setup script
+REDIS_URL = os.getenv("REDIS_URL")
+VOICE_SESSION_TTL_SECONDS = int(os.getenv("VOICE_SESSION_TTL_SECONDS", "600")) # Should outlive the longest expected call
 
 # Initialize Bedrock client
 bedrock_runtime_client = None
@@ -41,33 +55,96 @@ try:
         service_name='bedrock-runtime',
         region_name=AWS_REGION_NAME,
         aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        config=BotocoreConfig(
+            max_pool_connections=64, # Keep enough warm TLS connections for concurrent calls per worker
+            retries={'mode': 'adaptive', 'max_attempts': 3}, # Client-side rate limiting avoids retry storms on throttling
+            connect_timeout=2,
+            read_timeout=15, # A caller is waiting on the line; fail over to the apology prompt rather than hang
+            tcp_keepalive=True
+        )
     )
     logger.info("🏆 AWS Bedrock runtime client initialized successfully!")
 except Exception as e:
-    logger.error(f"❌ Error initializing AWS Bedrock runtime client: {e}")
-
-# In-memory session store for voice calls (CallSid -> session_data)
-# In production, use Redis or a proper session store for persistence and scale
+    logger.error("❌ Error initializing AWS Bedrock runtime client: %s", e)
+
+# Session store for voice calls (CallSid -> VoiceSession)
+# Redis is shared by all gunicorn workers and survives restarts; without REDIS_URL we fall back
+# to an in-process dict, which only works for a single worker (local development).
+# The pool connects lazily, so an unreachable Redis only surfaces when a call loads or saves its session.
+redis_client = None
+if REDIS_URL:
+    redis_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL))
+    logger.info("Redis session store configured.")
 VOICE_SESSION_STORE = {}
 
 # Twilio TaskRouter client and workspace info
 TASKROUTER_CLIENT = None
 WORKSPACE_INFO: WorkspaceInfo = None
 
+# Background workers for live-agent handoffs (TaskRouter task creation + unresolved chat logging)
+HANDOFF_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='handoff')
+
+def json_response(payload):
+    """Builds a JSON Flask response; orjson serializes straight to bytes, skipping jsonify's str round-trip."""
+    return _json_bytes_response(orjson.dumps(payload))
+
+def _json_bytes_response(body):
+    """Wraps already-serialized JSON bytes in a Flask response."""
+    return app.response_class(body, mimetype='application/json')
+
 # --- Helper Functions for Ozonetel Responses ---
 # IMPORTANT: These functions assume Ozonetel expects a JSON response for call control.
 # YOU MUST verify Ozonetel's API documentation for the exact JSON/XML format.
 
+# Fixed prompts spoken to callers; LLM replies and per-customer prompts are built per call
+GREETING_PROMPT = "Hello! Welcome to our financial assistant. How can I help you today?"
+NO_SPEECH_PROMPT = "I didn't catch that. Please tell me your query, like 'What is my EMI?' or 'Connect to agent'."
+ASK_ACCOUNT_ID_PROMPT = "To fetch your EMI details, please speak or enter your 10-digit account ID."
+HANDOFF_UNAVAILABLE_PROMPT = "I am unable to connect you to an agent right now. Please try again later."
+HANDOFF_HOLD_PROMPT = "Please wait while I connect you to the next available agent."
+UNCLEAR_INTENT_PROMPT = "I'm sorry, I didn't understand your request. You can ask about your EMI or say 'connect to agent'."
+OTP_SEND_FAILED_PROMPT = "There was an issue sending the OTP. Please try again later."
+ACCOUNT_NOT_FOUND_PROMPT = "I could not find an account with that ID. Please try again or say 'connect to agent'."
+EMI_UNAVAILABLE_PROMPT = "I could not retrieve your EMI details. Please contact support if the issue persists. Thank you."
+OTP_INCORRECT_PROMPT = "That OTP is incorrect. Please try again or say 'connect to agent'."
+FALLBACK_PROMPT = "I'm sorry, something went wrong. Please call again."
+ERROR_PROMPT = "I apologize, an unexpected error occurred. Please try again later."
+
+def _ozonetel_speak_payload(text, action):
+    """Serialized speak+action body."""
+    return orjson.dumps({"speak": text, action: True})
+
+# The fixed prompts are serialized once at import; a Response object itself can't be shared between requests.
+# Dynamic text (LLM replies, customer details) is serialized per call and never retained.
+_STATIC_SPEAK_PAYLOADS = {
+    (text, action): _ozonetel_speak_payload(text, action) for text, action in (
+        (GREETING_PROMPT, "listen"),
+        (NO_SPEECH_PROMPT, "listen"),
+        (ASK_ACCOUNT_ID_PROMPT, "listen"),
+        (HANDOFF_UNAVAILABLE_PROMPT, "hangup"),
+        (HANDOFF_HOLD_PROMPT, "listen"),
+        (UNCLEAR_INTENT_PROMPT, "listen"),
+        (OTP_SEND_FAILED_PROMPT, "hangup"),
+        (ACCOUNT_NOT_FOUND_PROMPT, "listen"),
+        (EMI_UNAVAILABLE_PROMPT, "hangup"),
+        (OTP_INCORRECT_PROMPT, "listen"),
+        (FALLBACK_PROMPT, "hangup"),
+        (ERROR_PROMPT, "hangup"),
+    )
+}
+
 def ozonetel_speak_and_listen(text):
     """Generates a JSON response for Ozonetel to speak text and then listen for user input."""
-    logger.info(f"Ozonetel Response: SPEAK '{text}' and LISTEN")
-    return jsonify({"speak": text, "listen": True})
+    logger.info("Ozonetel Response: SPEAK '%s' and LISTEN", text)
+    body = _STATIC_SPEAK_PAYLOADS.get((text, "listen")) or _ozonetel_speak_payload(text, "listen")
+    return _json_bytes_response(body)
 
 def ozonetel_speak_and_hangup(text):
     """Generates a JSON response for Ozonetel to speak text and then hang up the call."""
-    logger.info(f"Ozonetel Response: SPEAK '{text}' and HANGUP")
-    return jsonify({"speak": text, "hangup": True})
+    logger.info("Ozonetel Response: SPEAK '%s' and HANGUP", text)
+    body = _STATIC_SPEAK_PAYLOADS.get((text, "hangup")) or _ozonetel_speak_payload(text, "hangup")
+    return _json_bytes_response(body)
 
 def ozonetel_dial_agent(agent_phone_number):
     """
@@ -75,10 +152,10 @@ def ozonetel_dial_agent(agent_phone_number):
     This is a conceptual representation. Ozonetel's actual 'dial' mechanism
     might be different (e.g., specific XML or more complex JSON).
     """
-    logger.info(f"Ozonetel Response: DIAL agent {agent_phone_number}")
+    logger.info("Ozonetel Response: DIAL agent %s", agent_phone_number)
     # Ozonetel might require a 'from' number (your Ozonetel virtual number)
     # You might need to add `callerId: os.getenv("OZONETEL_PHONE_NUMBER")` if required
-    return jsonify({
+    return json_response({
         "dial": {
             "number": agent_phone_number,
             "timeout": 30, # seconds to wait for agent to answer
@@ -86,29 +163,67 @@ def ozonetel_dial_agent(agent_phone_number):
         }
     })
 
+# --- Voice Session Store Helpers ---
+
+@dataclass(slots=True)
+class VoiceSession:
+    """Per-call conversation state, keyed by CallSid in the session store."""
+    stage: str = 'initial_greeting'
+    intent: str | None = None
+    session_id: str = field(default_factory=lambda: str(uuid.uuid4())) # ClientInteraction.session_id for this call
+    customer_id: str | None = None
+    account_id: str | None = None
+    phone_number: str | None = None
+    masked_phone_number: str | None = None
+    phone_last4: str | None = None
+    emi_id: str | None = None
+    task_sid: str | None = None
+
+_VOICE_SESSION_FIELDS = frozenset(f.name for f in fields(VoiceSession))
+
+def load_voice_session(call_sid):
+    """Returns the stored VoiceSession for a CallSid, or None if this is a new call."""
+    if redis_client:
+        packed = redis_client.get(f"sess:{call_sid}")
+        if not packed:
+            return None
+        # Ignore keys written by an older/newer VoiceSession during a rolling deploy; missing ones take defaults
+        stored = msgpack.unpackb(packed)
+        return VoiceSession(**{key: value for key, value in stored.items() if key in _VOICE_SESSION_FIELDS})
+    return VOICE_SESSION_STORE.get(call_sid)
+
+def save_voice_session(call_sid, session_data):
+    """Persists a VoiceSession for a CallSid, refreshing its TTL when stored in Redis."""
+    if redis_client:
+        redis_client.setex(f"sess:{call_sid}", VOICE_SESSION_TTL_SECONDS, msgpack.packb(asdict(session_data)))
+    else:
+        VOICE_SESSION_STORE[call_sid] = session_data
+
 # --- LLM Functions (Bedrock with RAG) ---
 
-def call_bedrock_llm(prompt, model_id, system_prompt=None):
+# Ozonetel speaks a single JSON reply per turn, so a spoken answer never needs more than a few sentences
+VOICE_REPLY_MAX_TOKENS = 150
+
+def call_bedrock_llm(prompt, model_id, system_prompt=None, max_tokens=500):
     """
     Calls the Bedrock LLM with the given prompt.
+    Keep max_tokens close to what the caller really needs; decode time grows with it.
     """
     if not bedrock_runtime_client:
         logger.error("Bedrock client not initialized. Cannot make LLM call.")
         return "Sorry, the AI service is currently unavailable."
 
-    messages = []
-    if system_prompt:
-        messages.append({"role": "user", "content": system_prompt}) # Claude 3 uses user role for system instructions
-
-    messages.append({"role": "user", "content": prompt})
-
-
-    body = json.dumps({
-        "messages": messages,
-        "max_tokens": 500,
+    request_body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
         "temperature": 0.5,
         "top_p": 0.9
-    })
+    }
+    if system_prompt:
+        request_body["system"] = system_prompt # Claude 3 Messages API takes system instructions separately
+
+    body = orjson.dumps(request_body) # boto3 accepts bytes bodies as-is
 
     try:
         response = bedrock_runtime_client.invoke_model(
@@ -117,67 +232,112 @@ def call_bedrock_llm(prompt, model_id, system_prompt=None):
             accept='application/json',
             body=body
         )
-        response_body = json.loads(response.get('body').read())
+        response_body = orjson.loads(response.get('body').read())
         return response_body['content'][0]['text']
     except Exception as e:
-        logger.error(f"Error invoking Bedrock LLM {model_id}: {e}", exc_info=True)
+        logger.error("Error invoking Bedrock LLM %s: %s", model_id, e)
         return "I apologize, I'm having trouble processing your request right now. Please try again later."
 
 
+# Obvious requests are routed without a Bedrock round-trip; matched against whole words only
+_LIVE_AGENT_KEYWORDS = frozenset(("agent", "human", "representative", "support"))
+_EMI_KEYWORDS = frozenset(("emi", "emis", "loan", "installment", "instalment", "due"))
+
+# Static, so built once at import; cleandoc strips the source indentation that would otherwise be sent as tokens
+_INTENT_SYSTEM_PROMPT = inspect.cleandoc("""
+You are the intent classification step of a financial voice assistant. Analyze the user's query to determine their primary intent.
+Possible intents are:
+- 'query_emi': The user is asking about their EMI (Equated Monthly Installment) or loan details.
+- 'live_agent_request': The user explicitly wants to talk to a human agent, connect to support, or speak with a representative.
+- 'unclear': The intent cannot be clearly determined from the query or falls outside the defined intents.
+
+Also draft a short, polite reply (one or two sentences) to be spoken back to the caller.
+For 'unclear', ask them to rephrase and mention they can ask about their EMI or say 'connect to agent'.
+
+Respond with ONLY a JSON object of the form {"intent": "<intent>", "speech": "<reply>"}.
+Do not include any other text, explanation, or markdown.
+""")
+
+class _IntentParseError(Exception):
+    """Raised when the intent model's reply is not usable, so the result is not cached."""
+
 def classify_intent_with_llm(user_input):
     """
-    Classifies the user's intent using Bedrock LLM.
+    Classifies the user's intent and drafts the spoken reply.
     Possible intents: 'query_emi', 'live_agent_request', 'unclear'.
+    Returns an (intent, speech) tuple; speech is None if no reply was drafted.
     """
-    system_prompt = """
-    You are an intent classification system. Analyze the user's query to determine their primary intent.
-    Possible intents are:
-    - 'query_emi': The user is asking about their EMI (Equated Monthly Installment) or loan details.
-    - 'live_agent_request': The user explicitly wants to talk to a human agent, connect to support, or speak with a representative.
-    - 'unclear': The intent cannot be clearly determined from the query or falls outside the defined intents.
-
-    Respond with ONLY the intent name (e.g., 'query_emi', 'live_agent_request', 'unclear').
-    Do not include any other text, explanation, or punctuation.
-    """
-    prompt = f"User query: \"{user_input}\""
-    response = call_bedrock_llm(prompt, model_id=CLAUDE_INTENT_MODEL_ID, system_prompt=system_prompt)
-    response = response.strip().lower()
-
-    if "query_emi" in response:
-        return "query_emi"
-    elif "live_agent_request" in response:
-        return "live_agent_request"
-    else:
-        return "unclear"
+    normalized = " ".join(re.findall(r"[a-z0-9']+", user_input.lower()))
+    words = set(normalized.split())
+    if words & _LIVE_AGENT_KEYWORDS:
+        return "live_agent_request", None
+    if words & _EMI_KEYWORDS:
+        return "query_emi", None
+
+    try:
+        return _classify_intent_cached(normalized)
+    except _IntentParseError:
+        return "unclear", None
+
+@lru_cache(maxsize=4096)
+def _classify_intent_cached(normalized_input):
+    """Single Bedrock call returning (intent, speech); cached per normalized utterance."""
+    prompt = f"User query: \"{normalized_input}\""
+    response = call_bedrock_llm(prompt, model_id=CLAUDE_INTENT_MODEL_ID, system_prompt=_INTENT_SYSTEM_PROMPT, max_tokens=VOICE_REPLY_MAX_TOKENS)
 
-def generate_emi_response_with_rag(emi_details, customer_info):
+    try:
+        parsed = orjson.loads(response)
+        intent = str(parsed.get("intent", "")).strip().lower()
+        speech = parsed.get("speech") or None
+    except (ValueError, AttributeError):
+        # Model ignored the JSON instruction; fall back to substring matching
+        intent, speech = response.strip().lower(), None
+
+    if "query_emi" in intent:
+        return "query_emi", speech
+    elif "live_agent_request" in intent:
+        return "live_agent_request", speech
+    elif speech:
+        return "unclear", speech
+    # Nothing usable (e.g. the call failed and returned an apology string); don't cache it
+    raise _IntentParseError(response)
+
+def _format_amount(amount):
+    """Formats a monetary value to 2 decimals, or 'N/A' if it is missing."""
+    return f"{amount:.2f}" if amount is not None else 'N/A'
+
+def _format_date(value):
+    """Formats a datetime as YYYY-MM-DD, or 'N/A' if it is missing."""
+    return value.strftime('%Y-%m-%d') if value else 'N/A'
+
+def generate_emi_response_with_rag(emi_details, loan_details, customer_info, account_id, masked_phone_number):
     """
     Generates a natural language response for EMI details using Bedrock LLM with RAG.
     """
-    if not emi_details or not customer_info:
+    if not emi_details or not loan_details or not customer_info:
         return "I couldn't find your EMI details. Please ensure your account ID is correct."
 
-    # Prepare EMI data for LLM
-    emi_data_str = f"""
-    Loan ID: {emi_details.loan_id}
-    Principal Amount: {emi_details.principal_amount:.2f}
-    Interest Rate: {emi_details.interest_rate:.2f}%
-    Tenure (months): {emi_details.tenure_months}
-    Monthly EMI Amount: {emi_details.amount_due:.2f}
-    Next Due Date: {emi_details.due_date.strftime('%Y-%m-%d') if emi_details.due_date else 'N/A'}
-    Next Amount Due: {emi_details.amount_due:.2f if emi_details.amount_due is not None else 'N/A'}
-    Status: {emi_details.status}
-    Last Payment Date: {emi_details.payment_date.strftime('%Y-%m-%d') if emi_details.payment_date else 'N/A'}
-    Amount Paid (last): {emi_details.amount_paid:.2f if emi_details.amount_paid is not None else 'N/A'}
-    """
+    # Prepare EMI data for LLM (principal, rate and tenure live on the loan, not the EMI row)
+    emi_data_str = "\n".join((
+        f"Loan ID: {loan_details.loan_id}",
+        f"Principal Amount: {_format_amount(loan_details.principal_amount)}",
+        f"Interest Rate: {_format_amount(loan_details.interest_rate)}%",
+        f"Tenure (months): {loan_details.tenure_months}",
+        f"Monthly EMI Amount: {_format_amount(emi_details.amount_due)}",
+        f"Next Due Date: {_format_date(emi_details.due_date)}",
+        f"Next Amount Due: {_format_amount(emi_details.amount_due)}",
+        f"Status: {emi_details.status}",
+        f"Last Payment Date: {_format_date(emi_details.payment_date)}",
+        f"Amount Paid (last): {_format_amount(emi_details.amount_paid)}",
+    ))
 
     system_prompt = f"""
     You are a helpful and polite financial assistant providing EMI details.
     Here is the customer's information:
     - Customer ID: {customer_info.customer_id}
-    - Account ID: {customer_info.account_id}
+    - Account ID: {account_id}
     - Name: {customer_info.full_name}
-    - Phone Number (masked): {hide_number(customer_info.phone_number)}
+    - Phone Number (masked): {masked_phone_number}
 
     Here is the retrieved EMI data for the customer's loan:
     {emi_data_str}
@@ -187,11 +347,80 @@ def generate_emi_response_with_rag(emi_details, customer_info):
     Mention if the EMI is paid or pending. Keep the response natural for a voice interaction.
     """
     prompt = "Please provide the EMI details for the customer."
-    response = call_bedrock_llm(prompt, model_id=CLAUDE_MODEL_ID, system_prompt=system_prompt)
+    response = call_bedrock_llm(prompt, model_id=CLAUDE_MODEL_ID, system_prompt=system_prompt, max_tokens=VOICE_REPLY_MAX_TOKENS)
     return response
 
+# --- Live Agent Handoff ---
+
+def _create_handoff_task_and_log(call_sid, from_number, customer_id, account_id, session_id, user_speech_result):
+    """
+    Creates the TaskRouter Task for a voice handoff and stores the unresolved chat.
+    Runs on HANDOFF_EXECUTOR after the caller has already been told to hold.
+    """
+    try:
+        # Create TaskRouter Task
+        task_attributes = {
+            "customer_call_sid": call_sid,
+            "customer_phone": from_number, # The number calling in
+            "selected_product": "VoiceHandoff", # Specific product for voice handoff
+            "type": "voice_handoff_request",
+            "direction": "inbound"
+        }
+        task = build_twilio_client().taskrouter.workspaces(WORKSPACE_INFO.workspace_sid).tasks.create(
+            workflow_sid=WORKSPACE_INFO.workflow_sid,
+            attributes=orjson.dumps(task_attributes).decode(),
+            task_channel="voice" # Assuming a 'voice' TaskChannel exists in TaskRouter
+        )
+        logger.info("TaskRouter Task %s created for CallSid %s", task.sid, call_sid)
+
+        session_data = load_voice_session(call_sid)
+        if session_data:
+            session_data.task_sid = task.sid
+            save_voice_session(call_sid, session_data)
+    except Exception as e:
+        logger.error("Error creating TaskRouter Task for CallSid %s: %s", call_sid, e, exc_info=True)
+
+    try:
+        # Store unresolved chat for future analysis/follow-up
+        with db_session() as session:
+            session.add(UnresolvedChat(
+                customer_id=customer_id or 'N/A', # Use actual customer_id if known, else 'N/A'
+                account_id=account_id or 'N/A',
+                session_id=session_id,
+                summary=f"Voice call handoff requested by {from_number} for general assistance. Initial query: '{user_speech_result}'",
+                embedding_vector=None # Filled in once summaries are embedded; an empty list is not a valid Vector(1536)
+            ))
+        logger.info("Saved unresolved chat summary for CallSid %s", call_sid)
+    except Exception as e:
+        logger.error("Error saving unresolved chat for CallSid %s: %s", call_sid, e)
+
+# --- Database Statements ---
+# Hot-path queries are built once at import and bound per call, so only parameters change between requests.
+# They only read columns, so raiseload('*') skips the models' selectin collections (and fails loudly if
+# code starts touching a relationship here without loading it explicitly).
+
+_ACCOUNT_LOOKUP_STMT = select(Customer, CustomerAccount.account_id, EMI.emi_id)\
+    .join(CustomerAccount, CustomerAccount.customer_id == Customer.customer_id)\
+    .join(Loan, Loan.customer_id == Customer.customer_id)\
+    .join(EMI, EMI.loan_id == Loan.loan_id)\
+    .where(CustomerAccount.account_id == bindparam('account_id'))\
+    .order_by(EMI.created_at.desc())\
+    .limit(1)\
+    .options(raiseload('*'))
+
+_EMI_DETAILS_STMT = select(EMI, Loan, Customer)\
+    .join(Loan, Loan.loan_id == EMI.loan_id)\
+    .join(Customer, Customer.customer_id == Loan.customer_id)\
+    .where(EMI.emi_id == bindparam('emi_id'))\
+    .options(raiseload('*'))
+
 # --- Flask Routes ---
 
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    """Returns the request-scoped DB session's connection to the pool."""
+    Session.remove()
+
 @app.route('/')
 def home():
     return "Financial Voice Bot is running. Ready to receive calls!"
@@ -202,198 +431,171 @@ def handle_ozonetel_voice_call():
     from_number = request.form.get('From') # Customer's phone number
     user_speech_result = request.form.get('SpeechResult', '').strip() # Transcribed speech from Ozonetel
 
-    logger.info(f"Received Ozonetel webhook for CallSid: {call_sid}, From: {from_number}, Speech: '{user_speech_result}'")
+    logger.info("Received Ozonetel webhook for CallSid: %s, From: %s, Speech: '%s'", call_sid, from_number, user_speech_result)
 
     # Retrieve or initialize session data for this CallSid
     # Use uuid for session_id for ClientInteraction logging
-    session_id_str = VOICE_SESSION_STORE.get(call_sid, {}).get('session_id')
-    current_session_id = uuid.UUID(session_id_str) if session_id_str else uuid.uuid4()
-    session_data = VOICE_SESSION_STORE.get(call_sid, {'stage': 'initial_greeting', 'intent': None, 'session_id': str(current_session_id)})
+    try:
+        session_data = load_voice_session(call_sid) or VoiceSession()
+    except Exception as e:
+        # Redis unreachable or an unreadable session blob: apologize on the line rather than return a 500
+        logger.error("Error loading voice session for CallSid %s: %s", call_sid, e, exc_info=True)
+        return ozonetel_speak_and_hangup(ERROR_PROMPT)
+    current_session_id = uuid.UUID(session_data.session_id)
+
 
+    # Interaction rows for this turn; written in one transaction in the finally block
+    pending_logs = []
+    response_text = None # Bot reply for this turn, logged in the finally block once set
 
     try:
         # Log user's speech input (if not initial greeting and there's speech)
-        if user_speech_result and session_data['stage'] != 'initial_greeting':
-            with Session() as db_session:
-                ClientInteraction(
-                    session_id=current_session_id,
-                    customer_id=session_data.get('customer_id', 'N/A'),
-                    sender='user',
-                    message_text=user_speech_result,
-                    stage=session_data['stage'],
-                    intent=session_data.get('intent')
-                )
-                db_session.add(ClientInteraction(
-                    session_id=current_session_id,
-                    customer_id=session_data.get('customer_id', 'N/A'),
-                    sender='user',
-                    message_text=user_speech_result,
-                    stage=session_data['stage'],
-                    intent=session_data.get('intent')
-                ))
-                db_session.commit()
-
-        response_text = ""
+        if user_speech_result and session_data.stage != 'initial_greeting':
+            pending_logs.append(ClientInteraction(
+                session_id=current_session_id,
+                customer_id=session_data.customer_id, # NULL until the caller is identified (FK to customer)
+                sender='user',
+                message_text=user_speech_result,
+                stage=session_data.stage,
+                intent=session_data.intent
+            ))
+
         # Initial greeting
-        if session_data['stage'] == 'initial_greeting':
-            session_data['stage'] = 'awaiting_query'
-            VOICE_SESSION_STORE[call_sid] = session_data
-            response_text = "Hello! Welcome to our financial assistant. How can I help you today?"
+        if session_data.stage == 'initial_greeting':
+            session_data.stage = 'awaiting_query'
+            save_voice_session(call_sid, session_data)
+            response_text = GREETING_PROMPT
             return ozonetel_speak_and_listen(response_text)
 
         # Awaiting user query after greeting or previous prompt
-        if session_data['stage'] == 'awaiting_query':
+        if session_data.stage == 'awaiting_query':
             if not user_speech_result:
-                response_text = "I didn't catch that. Please tell me your query, like 'What is my EMI?' or 'Connect to agent'."
+                response_text = NO_SPEECH_PROMPT
                 return ozonetel_speak_and_listen(response_text)
 
-            intent = classify_intent_with_llm(user_speech_result)
-            session_data['intent'] = intent
-            logger.info(f"Classified intent for '{user_speech_result}': {intent}")
+            intent, llm_speech = classify_intent_with_llm(user_speech_result)
+            session_data.intent = intent
+            logger.info("Classified intent for '%s': %s", user_speech_result, intent)
 
             if intent == 'query_emi':
-                session_data['stage'] = 'ask_account_id'
-                VOICE_SESSION_STORE[call_sid] = session_data
-                response_text = "To fetch your EMI details, please speak or enter your 10-digit account ID."
+                session_data.stage = 'ask_account_id'
+                save_voice_session(call_sid, session_data)
+                response_text = ASK_ACCOUNT_ID_PROMPT
                 return ozonetel_speak_and_listen(response_text)
             elif intent == 'live_agent_request':
-                session_data['stage'] = 'handoff_init'
-                VOICE_SESSION_STORE[call_sid] = session_data
-                logger.info(f"Handoff requested for CallSid {call_sid}. Creating TaskRouter Task.")
+                session_data.stage = 'handoff_init'
+                save_voice_session(call_sid, session_data)
+                logger.info("Handoff requested for CallSid %s. Creating TaskRouter Task.", call_sid)
                 
                 # --- TaskRouter Handoff Logic ---
                 global WORKSPACE_INFO
                 if not WORKSPACE_INFO:
                     # Attempt to get workspace info if not already loaded
-                    client = build_twilio_client()
-                    WORKSPACE_INFO = taskrouter_config_setup(client)
+                    WORKSPACE_INFO = taskrouter_config_setup(build_twilio_client())
 
                 if not WORKSPACE_INFO or not WORKSPACE_INFO.workflow_sid or not WORKSPACE_INFO.workspace_sid:
                     logger.error("TaskRouter Workspace info not available for handoff.")
-                    response_text = "I am unable to connect you to an agent right now. Please try again later."
+                    response_text = HANDOFF_UNAVAILABLE_PROMPT
                     return ozonetel_speak_and_hangup(response_text)
 
-                try:
-                    # Create TaskRouter Task
-                    customer_phone_number = from_number # The number calling in
-                    task_attributes = {
-                        "customer_call_sid": call_sid,
-                        "customer_phone": customer_phone_number,
-                        "selected_product": "VoiceHandoff", # Specific product for voice handoff
-                        "type": "voice_handoff_request",
-                        "direction": "inbound"
-                    }
-                    twilio_client = build_twilio_client()
-                    task = twilio_client.taskrouter.workspaces(WORKSPACE_INFO.workspace_sid).tasks.create(
-                        workflow_sid=WORKSPACE_INFO.workflow_sid,
-                        attributes=json.dumps(task_attributes),
-                        task_channel="voice" # Assuming a 'voice' TaskChannel exists in TaskRouter
-                    )
-                    session_data['task_sid'] = task.sid
-                    VOICE_SESSION_STORE[call_sid] = session_data
-                    logger.info(f"TaskRouter Task {task.sid} created for CallSid {call_sid}")
-                    
-                    # Store unresolved chat for future analysis/follow-up
-                    with Session() as db_session:
-                        unresolved_chat = UnresolvedChat(
-                            customer_id=session_data.get('customer_id', 'N/A'), # Use actual customer_id if known, else 'N/A'
-                            account_id=session_data.get('account_id', 'N/A'),
-                            session_id=str(current_session_id),
-                            summary=f"Voice call handoff requested by {from_number} for general assistance. Initial query: '{user_speech_result}'",
-                            embedding_vector=[] # Placeholder for actual embedding
-                        )
-                        db_session.add(unresolved_chat)
-                        db_session.commit()
-                        logger.info(f"Saved unresolved chat summary for CallSid {call_sid}")
-
-                    response_text = "Please wait while I connect you to the next available agent."
-                    return ozonetel_speak_and_listen(response_text) # Keep listening in case of agent busy
-                except Exception as e:
-                    logger.error(f"Error creating TaskRouter Task: {e}", exc_info=True)
-                    response_text = "I'm sorry, I encountered an issue trying to connect you to an agent. Please try again later."
-                    return ozonetel_speak_and_hangup(response_text)
+                # Task creation and the unresolved-chat insert run off the request path so the caller
+                # hears the hold prompt immediately instead of waiting on Twilio and Postgres
+                HANDOFF_EXECUTOR.submit(
+                    _create_handoff_task_and_log,
+                    call_sid, from_number, session_data.customer_id, session_data.account_id,
+                    str(current_session_id), user_speech_result
+                )
+                response_text = HANDOFF_HOLD_PROMPT
+                return ozonetel_speak_and_listen(response_text) # Keep listening in case of agent busy
 
             else: # Unclear intent
-                response_text = "I'm sorry, I didn't understand your request. You can ask about your EMI or say 'connect to agent'."
+                response_text = llm_speech or UNCLEAR_INTENT_PROMPT
                 return ozonetel_speak_and_listen(response_text)
 
         # Awaiting Account ID
-        elif session_data['stage'] == 'ask_account_id':
+        elif session_data.stage == 'ask_account_id':
             account_id = extract_digits_from_speech(user_speech_result)
-            logger.info(f"Extracted Account ID: {account_id}")
+            logger.info("Extracted Account ID: %s", account_id)
 
             with Session() as db_session:
-                # Assuming database.py has fetch_customer_by_account that joins Customer and CustomerAccount
-                customer_data = db_session.query(Customer, EMI).join(EMI, Customer.customer_id == EMI.customer_id).filter(Customer.account_id == account_id).first()
-                
+                # Resolve account -> customer -> latest EMI in one indexed round-trip
+                customer_data = db_session.execute(_ACCOUNT_LOOKUP_STMT, {'account_id': account_id}).first()
+
             if customer_data:
-                customer, emi_record = customer_data
-                session_data['customer_id'] = customer.customer_id
-                session_data['account_id'] = customer.account_id
-                session_data['phone_number'] = customer.phone_number
-                session_data['stage'] = 'otp_pending'
-                VOICE_SESSION_STORE[call_sid] = session_data
+                customer, customer_account_id, emi_id = customer_data
+                session_data.customer_id = customer.customer_id
+                session_data.account_id = customer_account_id
+                session_data.phone_number = customer.phone_number
+                session_data.masked_phone_number = hide_number(customer.phone_number) # Computed once per call, reused in prompts and logs
+                session_data.phone_last4 = customer.phone_number[-4:]
+                session_data.emi_id = str(emi_id) # Reused after OTP verification instead of re-querying
+                session_data.stage = 'otp_pending'
+                save_voice_session(call_sid, session_data)
 
                 # Send OTP via Twilio
                 if send_sms_otp(customer.phone_number, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_MESSAGING_SERVICE_SID):
-                    logger.info(f"OTP sent to {hide_number(customer.phone_number)} for account_id={customer.account_id}")
-                    response_text = f"I have sent a 6-digit OTP to your registered mobile number ending in {customer.phone_number[-4:]}. Please speak the OTP now."
+                    logger.info("OTP sent to %s for account_id=%s", session_data.masked_phone_number, customer_account_id)
+                    response_text = f"I have sent a 6-digit OTP to your registered mobile number ending in {session_data.phone_last4}. Please speak the OTP now."
                     return ozonetel_speak_and_listen(response_text)
                 else:
-                    response_text = "There was an issue sending the OTP. Please try again later."
+                    response_text = OTP_SEND_FAILED_PROMPT
                     return ozonetel_speak_and_hangup(response_text)
             else:
-                response_text = "I could not find an account with that ID. Please try again or say 'connect to agent'."
+                response_text = ACCOUNT_NOT_FOUND_PROMPT
                 return ozonetel_speak_and_listen(response_text)
 
         # Awaiting OTP
-        elif session_data['stage'] == 'otp_pending':
+        elif session_data.stage == 'otp_pending':
             otp_code = extract_digits_from_speech(user_speech_result)
-            logger.info(f"Extracted OTP: {otp_code}")
+            logger.info("Extracted %d-digit OTP from speech", len(otp_code))
 
-            if verify_otp_code(session_data['phone_number'], otp_code):
-                session_data['stage'] = 'verified'
-                VOICE_SESSION_STORE[call_sid] = session_data
-                logger.info(f"🏆 OTP verified for phone {session_data['phone_number']}")
+            if verify_otp_code(session_data.phone_number, otp_code):
+                session_data.stage = 'verified'
+                save_voice_session(call_sid, session_data)
+                logger.info("🏆 OTP verified for phone %s", session_data.masked_phone_number)
 
-                # Fetch EMI details
+                # Fetch EMI details by the primary key cached at account lookup
                 with Session() as db_session:
-                    emi_record = db_session.query(EMI).filter_by(
-                        loan_id=session_data['account_id'] # Assuming loan_id is same as account_id for EMI, adjust if needed
-                    ).order_by(EMI.created_at.desc()).first()
-                    customer_info = db_session.query(Customer).filter_by(customer_id=session_data['customer_id']).first()
+                    emi_data = db_session.execute(_EMI_DETAILS_STMT, {'emi_id': uuid.UUID(session_data.emi_id)}).first()
+                emi_record, loan_record, customer_info = emi_data if emi_data else (None, None, None)
 
                 if emi_record and customer_info:
-                    response_text = generate_emi_response_with_rag(emi_record, customer_info)
+                    response_text = generate_emi_response_with_rag(emi_record, loan_record, customer_info, session_data.account_id, session_data.masked_phone_number)
                     return ozonetel_speak_and_hangup(response_text + " Thank you for calling.")
                 else:
-                    response_text = "I could not retrieve your EMI details. Please contact support if the issue persists. Thank you."
+                    response_text = EMI_UNAVAILABLE_PROMPT
                     return ozonetel_speak_and_hangup(response_text)
             else:
-                response_text = "That OTP is incorrect. Please try again or say 'connect to agent'."
+                response_text = OTP_INCORRECT_PROMPT
                 return ozonetel_speak_and_listen(response_text)
 
         # Default fallback for unhandled stages
-        response_text = "I'm sorry, something went wrong. Please call again."
+        response_text = FALLBACK_PROMPT
         return ozonetel_speak_and_hangup(response_text)
 
     except Exception as e:
-        logger.error(f"Error in handle_ozonetel_voice_call for CallSid {call_sid}: {e}", exc_info=True)
-        response_text = "I apologize, an unexpected error occurred. Please try again later."
+        logger.error("Error in handle_ozonetel_voice_call for CallSid %s: %s", call_sid, e, exc_info=True)
+        response_text = ERROR_PROMPT
         return ozonetel_speak_and_hangup(response_text)
     finally:
-        # Log bot's response
-        if 'response_text' in locals() and response_text:
-            with Session() as db_session:
-                db_session.add(ClientInteraction(
-                    session_id=current_session_id,
-                    customer_id=session_data.get('customer_id', 'N/A'),
-                    sender='bot',
-                    message_text=response_text,
-                    stage=session_data['stage'],
-                    intent=session_data.get('intent')
-                ))
-                db_session.commit()
+        # Log bot's response and flush this turn's interactions in a single transaction
+        if response_text:
+            pending_logs.append(ClientInteraction(
+                session_id=current_session_id,
+                customer_id=session_data.customer_id,
+                sender='bot',
+                message_text=response_text,
+                stage=session_data.stage,
+                intent=session_data.intent
+            ))
+        if pending_logs:
+            try:
+                with Session() as db_session:
+                    db_session.add_all(pending_logs)
+                    db_session.commit()
+            except Exception as e:
+                # Never fail the caller's turn because interaction logging failed
+                logger.error("Error logging interactions for CallSid %s: %s", call_sid, e)
 
 @app.route('/assignment', methods=['POST'])
 def handle_taskrouter_assignment():
@@ -406,16 +608,16 @@ def handle_taskrouter_assignment():
         if not assignment_info: # Fallback if content-type is not application/json
             assignment_info = request.form.to_dict()
 
-        logger.info(f"Received TaskRouter Assignment: {assignment_info}")
+        logger.info("Received TaskRouter Assignment: %s", assignment_info)
 
-        task_attributes = json.loads(assignment_info.get('TaskAttributes', '{}'))
-        worker_attributes = json.loads(assignment_info.get('WorkerAttributes', '{}'))
+        task_attributes = orjson.loads(assignment_info.get('TaskAttributes', '{}'))
+        worker_attributes = orjson.loads(assignment_info.get('WorkerAttributes', '{}'))
         worker_contact_uri = worker_attributes.get('contact_uri') # This is the agent's phone number from TaskRouter worker config
         customer_call_sid = task_attributes.get('customer_call_sid') # Original CallSid from Ozonetel
 
         if not worker_contact_uri or not customer_call_sid:
             logger.error("Missing worker_contact_uri or customer_call_sid in assignment.")
-            return jsonify({"instruction": "reject"}) # Reject assignment if critical info is missing
+            return json_response({"instruction": "reject"}) # Reject assignment if critical info is missing
 
         # --- Instruct Ozonetel to bridge the call ---
         # This is the point where we tell Ozonetel to connect the original call_sid
@@ -431,11 +633,11 @@ def handle_taskrouter_assignment():
         # The instruction for TaskRouter here is typically 'accept' or 'call'.
         # For an external voice platform like Ozonetel, 'accept' is more appropriate
         # as Twilio TaskRouter is not directly handling the call itself after assignment.
-        return jsonify({"instruction": "accept"})
+        return json_response({"instruction": "accept"})
         
     except Exception as e:
-        logger.error(f"Error in TaskRouter assignment handler: {e}", exc_info=True)
-        return jsonify({"instruction": "reject"}) # Reject assignment on error
+        logger.error("Error in TaskRouter assignment handler: %s", e, exc_info=True)
+        return json_response({"instruction": "reject"}) # Reject assignment on error
 
 @app.route('/events', methods=['POST'])
 def handle_taskrouter_events():
@@ -443,7 +645,7 @@ def handle_taskrouter_events():
     Receives events from Twilio TaskRouter.
     Used for logging and debugging TaskRouter's activity (e.g., Task created, Worker status change).
     """
-    logger.info(f"Received TaskRouter Event: {request.form.to_dict()}")
+    logger.info("Received TaskRouter Event: %s", request.form.to_dict())
     return "", 200 # Acknowledge receipt
 
 
@@ -474,43 +676,43 @@ def update_worker_activity():
     # You might need to normalize from_number if it comes in different formats
     worker_sid = WORKSPACE_INFO.workers.get(from_number) # Get worker SID by their phone number
     if not worker_sid:
-        logger.warning(f"No worker found for phone number: {from_number}. Registered workers: {WORKSPACE_INFO.workers.keys()}")
+        logger.warning("No worker found for phone number: %s. Registered workers: %s", from_number, WORKSPACE_INFO.workers.keys())
         # You might want to send an SMS reply here, e.g., "You are not a registered worker."
         return f"Worker with number {from_number} not found.", 404
 
-    target_activity_sid = None
-    if message_body == 'available':
-        target_activity_sid = WORKSPACE_INFO.activities.get('Available').sid
-    elif message_body == 'offline':
-        target_activity_sid = WORKSPACE_INFO.activities.get('Offline').sid
-    elif message_body == 'busy':
-        target_activity_sid = WORKSPACE_INFO.activities.get('Busy').sid
-    else:
-        logger.info(f"Unknown activity command from {from_number}: '{message_body}'")
+    target_activity_sid = WORKSPACE_INFO.command_activity_sids.get(message_body)
+    if not target_activity_sid:
+        logger.info("Unknown activity command from %s: '%s'", from_number, message_body)
         # Send SMS back: "Invalid command. Use 'available', 'offline', or 'busy'."
         return "Invalid command. Please use 'available', 'offline', or 'busy'.", 400
 
-    if target_activity_sid:
-        try:
-            twilio_client = build_twilio_client()
-            twilio_client.taskrouter.workspaces(WORKSPACE_INFO.workspace_sid)\
-                          .workers(worker_sid).update(activity_sid=target_activity_sid)
-            logger.info(f"Worker {worker_sid} ({from_number}) activity set to {message_body.capitalize()}")
-            # Send SMS back to agent: "Your status is now {message_body.capitalize()}."
-            return f"Your status is now {message_body.capitalize()}.", 200
-        except Exception as e:
-            logger.error(f"Error updating worker activity for {from_number}: {e}", exc_info=True)
-            return "Failed to update your status. Please try again.", 500
-    return "No activity specified or invalid.", 400
+    try:
+        twilio_client = build_twilio_client()
+        twilio_client.taskrouter.workspaces(WORKSPACE_INFO.workspace_sid)\
+                      .workers(worker_sid).update(activity_sid=target_activity_sid)
+        logger.info("Worker %s (%s) activity set to %s", worker_sid, from_number, message_body.capitalize())
+        # Send SMS back to agent: "Your status is now {message_body.capitalize()}."
+        return f"Your status is now {message_body.capitalize()}.", 200
+    except Exception as e:
+        logger.error("Error updating worker activity for %s: %s", from_number, e, exc_info=True)
+        return "Failed to update your status. Please try again.", 500
 
 
 if __name__ == '__main__':
-    # Initialize database and sample data on startup
-    with app.app_context():
-        setup_database()
-
-    # Load TaskRouter config on startup
-    TASKROUTER_CLIENT = build_twilio_client() # Initialize once
-    WORKSPACE_INFO = taskrouter_config_setup(TASKROUTER_CLIENT)
+    # Initialize database/sample data and load TaskRouter config concurrently on startup;
+    # both are I/O-bound (Postgres vs Twilio REST), so cold start takes max(A, B) rather than A + B
+    def _setup_database_in_app_context():
+        with app.app_context():
+            setup_database()
+
+    def _setup_taskrouter():
+        client = build_twilio_client() # Initialize once
+        return client, taskrouter_config_setup(client)
+
+    with ThreadPoolExecutor(max_workers=2) as startup_executor:
+        database_future = startup_executor.submit(_setup_database_in_app_context)
+        taskrouter_future = startup_executor.submit(_setup_taskrouter)
+        database_future.result()
+        TASKROUTER_CLIENT, WORKSPACE_INFO = taskrouter_future.result()
 
     app.run(debug=os.getenv("FLASK_DEBUG") == "True", host='0.0.0.0', port=5000)
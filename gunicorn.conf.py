@@ -0,0 +1,10 @@
+# gunicorn.conf.py
+# Loaded automatically by gunicorn from the working directory (see Procfile).
+
+def post_fork(server, worker):
+    # psycopg2 talks to Postgres from C, so gevent's monkey-patching does not reach it.
+    # Patch it per worker so DB round-trips yield to other in-flight calls like Bedrock/Twilio do.
+    if worker.__class__.__module__.startswith('gunicorn.workers.ggevent'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+        server.log.info("psycopg2 patched for gevent in worker %s", worker.pid)
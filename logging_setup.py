@@ -0,0 +1,30 @@
+# logging_setup.py
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+_log_listener = None
+
+def configure_logging(level=logging.INFO):
+    """
+    Configures root logging once per process; later calls are no-ops.
+    Callers only enqueue records; a background listener does the (blocking) stderr writes.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _log_listener = QueueListener(log_queue, stream_handler)
+    # QueueHandler.prepare() formats records before queueing them; keep that to the bare message
+    # so the listener's formatter adds the only timestamp/level prefix
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop) # Flush queued records on shutdown
@@ -1,12 +1,16 @@
 import os
 import json
+import hashlib
 import logging
+import tempfile
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
 HOST = os.getenv("HOST")
@@ -16,34 +20,108 @@ TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 
 WORKSPACE_NAME = 'Financial Voice Bot Workspace'
+AGENT_ACTIVITY_COMMANDS = ('Available', 'Offline', 'Busy') # Activities agents may switch to by SMS
+# Resolved SIDs are persisted here so fresh processes can skip setup; FORCE_REBUILD=1 ignores it and recreates the workspace
+WORKSPACE_CACHE_PATH = os.path.expanduser(os.getenv("TWILIO_CACHE_PATH", "~/.voice_bot/twilio_cache.json"))
+FORCE_REBUILD = os.getenv("FORCE_REBUILD") == "1"
+DELETE_MAX_WORKERS = 16 # Twilio REST calls are I/O-bound, so deletes can overlap their round-trips
+
+def _worker_definition(friendly_name, number, products):
+    """Builds a worker definition with its attributes serialized once."""
+    attributes = {
+        "products": products,
+        "contact_uri": number # The phone number TaskRouter will use to reach the worker
+    }
+    return {'friendly_name': friendly_name, 'number': number, 'attributes': attributes,
+            'attributes_json': json.dumps(attributes), 'initial_activity': 'Available'}
+
+# Static setup definitions, built once at import instead of on every setup() call
+_WORKER_DEFINITIONS = (
+    _worker_definition('Alice', ALICE_NUMBER, ["ProgrammableVoice"]),
+    _worker_definition('Bob', BOB_NUMBER, ["ProgrammableSMS", "GeneralSupport"]),
+    # LiveAgent_1 also maps to Alice's number, but has 'LiveAgent' and 'VoiceHandoff' skills
+    _worker_definition('LiveAgent_1', ALICE_NUMBER, ["LiveAgent", "VoiceHandoff"]),
+)
+_WORKER_NAMES = frozenset(d['friendly_name'] for d in _WORKER_DEFINITIONS)
+
+_QUEUE_DEFINITIONS = (
+    {'friendly_name': 'Default', 'target_workers': '1==1'},
+    {'friendly_name': 'SMS', 'target_workers': '"ProgrammableSMS" in products'},
+    {'friendly_name': 'Voice', 'target_workers': '"ProgrammableVoice" in products'},
+    {'friendly_name': 'LiveAgent_Handoff', 'target_workers': '"LiveAgent" in products AND "VoiceHandoff" in products'}, # For voice handoff
+)
+_QUEUE_NAMES = frozenset(d['friendly_name'] for d in _QUEUE_DEFINITIONS)
 
 def first(items):
     """Helper to get the first item from a list or None."""
     return items[0] if items else None
 
+# Process-wide Twilio client; its pooled HTTP session keeps TLS connections to Twilio alive between calls
+_CLIENT = None
+
 def build_client():
-    """Builds and returns a Twilio REST Client."""
-    if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
-        logger.error("TWILIO_ACCOUNT_SID or TWILIO_AUTH_TOKEN not set in .env")
-        raise ValueError("Twilio credentials missing.")
-    return Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    """Returns the shared Twilio REST Client, building it on first use."""
+    global _CLIENT
+    if _CLIENT is None:
+        if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
+            logger.error("TWILIO_ACCOUNT_SID or TWILIO_AUTH_TOKEN not set in .env")
+            raise ValueError("Twilio credentials missing.")
+        _CLIENT = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=TwilioHttpClient(pool_connections=True))
+    return _CLIENT
+
+def delete_resources(resources, delete, kind):
+    """Deletes TaskRouter resources concurrently; `delete` is called with each resource SID."""
+    def delete_one(resource):
+        logger.info("Deleting existing %s '%s' with SID: %s", kind, resource.friendly_name, resource.sid)
+        try:
+            delete(resource.sid)
+        except Exception as e:
+            logger.warning("Failed to delete %s %s: %s. It might be in use or already deleted.", kind, resource.sid, e)
+
+    if not resources:
+        return
+    with ThreadPoolExecutor(max_workers=min(DELETE_MAX_WORKERS, len(resources))) as executor:
+        list(executor.map(delete_one, resources))
+
+def index_existing(resources, friendly_names):
+    """Maps each wanted friendly name to its first existing resource; extra same-named resources are returned as duplicates."""
+    by_name, duplicates = {}, []
+    for resource in resources:
+        if resource.friendly_name not in friendly_names:
+            continue
+        if resource.friendly_name in by_name:
+            duplicates.append(resource)
+        else:
+            by_name[resource.friendly_name] = resource
+    return by_name, duplicates
 
 def get_activities_dict(client, workspace_sid):
     """Fetches and returns a dictionary of activities by friendly name."""
-    logger.info(f"Fetching activities for workspace SID: {workspace_sid}")
+    logger.info("Fetching activities for workspace SID: %s", workspace_sid)
     activities = client.taskrouter.workspaces(workspace_sid).activities.list()
     if not activities:
         logger.warning("No activities found in the workspace. This might indicate an issue.")
     return {activity.friendly_name: activity for activity in activities}
 
 class WorkspaceInfo:
-    """A class to hold key TaskRouter SIDs and objects."""
-    def __init__(self, workspace, workflow, activities, workers):
-        self.workflow_sid = workflow.sid
-        self.workspace_sid = workspace.sid
-        self.activities = activities # Dict of activity friendly_name -> activity object
-        self.post_work_activity_sid = activities.get('Available').sid if 'Available' in activities else None
+    """A class to hold key TaskRouter SIDs."""
+    def __init__(self, workspace_sid, workflow_sid, activities, workers):
+        self.workflow_sid = workflow_sid
+        self.workspace_sid = workspace_sid
+        self.activities = activities # Dict of activity friendly_name -> activity SID
+        self.post_work_activity_sid = activities.get('Available')
         self.workers = workers # Dict of worker_number -> worker_sid
+        # Dict of agent SMS command ('available', 'offline', 'busy') -> activity SID, built once
+        self.command_activity_sids = {name.lower(): activities[name] for name in AGENT_ACTIVITY_COMMANDS if name in activities}
+
+    def to_dict(self):
+        """Returns the JSON-serializable SIDs needed to rebuild this object."""
+        return {
+            'workspace_sid': self.workspace_sid,
+            'workflow_sid': self.workflow_sid,
+            'activities': self.activities,
+            'workers': self.workers,
+        }
 
     def __repr__(self):
         return (f"<WorkspaceInfo(workspace_sid='{self.workspace_sid}', "
@@ -54,6 +132,57 @@ class WorkspaceInfo:
 # Cache to avoid re-creating TaskRouter resources during development if possible
 _WORKSPACE_CACHE = {}
 
+def setup_fingerprint():
+    """Hashes everything the cached SIDs depend on: Twilio account, callback host, worker and queue definitions."""
+    inputs = {
+        'account_sid': TWILIO_ACCOUNT_SID,
+        'host': HOST,
+        'workers': [(d['friendly_name'], d['number'], d['attributes_json']) for d in _WORKER_DEFINITIONS],
+        'queues': [(d['friendly_name'], d['target_workers']) for d in _QUEUE_DEFINITIONS],
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+def load_cached_workspace_info(client):
+    """
+    Rebuilds WorkspaceInfo from the on-disk cache, or returns None if there is no usable cache.
+    Only fetches the cached workspace and workflow to confirm they still exist; nothing is listed or created.
+    """
+    try:
+        with open(WORKSPACE_CACHE_PATH) as f:
+            cached = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable TaskRouter cache %s: %s", WORKSPACE_CACHE_PATH, e)
+        return None
+
+    # A different account, host, agent number or worker/queue definition makes the cached SIDs stale
+    if cached.get('fingerprint') != setup_fingerprint():
+        logger.info("TaskRouter cache was built for a different account, host or worker/queue setup. Rebuilding.")
+        return None
+
+    try:
+        workspace = client.taskrouter.workspaces(cached['workspace_sid'])
+        workspace.fetch()
+        workspace.workflows(cached['workflow_sid']).fetch()
+        return WorkspaceInfo(cached['workspace_sid'], cached['workflow_sid'], cached['activities'], cached['workers'])
+    except Exception as e:
+        logger.info("Cached TaskRouter workspace is no longer valid (%s). Rebuilding.", e)
+        return None
+
+def save_cached_workspace_info(workspace_info):
+    """Atomically writes the resolved SIDs to the on-disk cache; failures are logged and otherwise ignored."""
+    payload = dict(workspace_info.to_dict(), host=HOST, fingerprint=setup_fingerprint())
+    cache_dir = os.path.dirname(WORKSPACE_CACHE_PATH)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a sibling temp file and rename, so a concurrently starting process never reads a partial file
+        with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix='.tmp', delete=False) as f:
+            json.dump(payload, f)
+        os.replace(f.name, WORKSPACE_CACHE_PATH)
+    except OSError as e:
+        logger.warning("Failed to write TaskRouter cache %s: %s", WORKSPACE_CACHE_PATH, e)
+
 def setup(client):
     """
     Sets up or retrieves the TaskRouter Workspace, Workers, Queues, and Workflow.
@@ -65,55 +194,71 @@ def setup(client):
         logger.info("TaskRouter Workspace info already in cache. Reusing.")
         return _WORKSPACE_CACHE['WORKSPACE_INFO']
 
+    if not FORCE_REBUILD:
+        workspace_info = load_cached_workspace_info(client)
+        if workspace_info:
+            logger.info("Reusing TaskRouter Workspace from %s: %s", WORKSPACE_CACHE_PATH, workspace_info)
+            _WORKSPACE_CACHE['WORKSPACE_INFO'] = workspace_info
+            return workspace_info
+
     logger.info("Setting up TaskRouter Workspace...")
-    workspace = create_workspace(client)
-    logger.info(f"Workspace '{workspace.friendly_name}' created/verified with SID: {workspace.sid}")
+    workspace = create_workspace(client, force_rebuild=FORCE_REBUILD)
+    logger.info("Workspace '%s' created/verified with SID: %s", workspace.friendly_name, workspace.sid)
 
     activities = get_activities_dict(client, workspace.sid)
     # Ensure 'Available', 'Offline', 'Busy', 'Unavailable' activities exist
     required_activities = ['Available', 'Offline', 'Busy', 'Unavailable']
     for req_act in required_activities:
         if req_act not in activities:
-            logger.error(f"Required activity '{req_act}' not found in workspace. Attempting to create.")
+            logger.error("Required activity '%s' not found in workspace. Attempting to create.", req_act)
             try:
                 # 'Available' activity needs to be marked as available=True
                 is_available = True if req_act == 'Available' else False
                 new_activity = client.taskrouter.workspaces(workspace.sid).activities.create(friendly_name=req_act, available=is_available)
                 activities[req_act] = new_activity
-                logger.info(f"Created missing activity: {req_act}")
+                logger.info("Created missing activity: %s", req_act)
             except Exception as e:
-                logger.error(f"Failed to create activity {req_act}: {e}")
+                logger.error("Failed to create activity %s: %s", req_act, e)
                 # This is a critical failure, as essential activities are missing.
                 raise RuntimeError(f"Failed to set up TaskRouter: Missing required activity {req_act}")
 
 
     workers = create_workers(client, workspace, activities)
-    logger.info(f"Workers created/verified: {workers}")
+    logger.info("Workers created/verified: %s", workers)
 
     queues = create_task_queues(client, workspace, activities)
-    logger.info(f"Task Queues created/verified: {', '.join(queues.keys())}")
+    logger.info("Task Queues created/verified: %s", ', '.join(queues.keys()))
 
     workflow = create_workflow(client, workspace, queues)
-    logger.info(f"Workflow '{workflow.friendly_name}' created/verified with SID: {workflow.sid}")
+    logger.info("Workflow '%s' created/verified with SID: %s", workflow.friendly_name, workflow.sid)
 
-    workspace_info = WorkspaceInfo(workspace, workflow, activities, workers)
+    activity_sids = {name: activity.sid for name, activity in activities.items()}
+    workspace_info = WorkspaceInfo(workspace.sid, workflow.sid, activity_sids, workers)
     _WORKSPACE_CACHE['WORKSPACE_INFO'] = workspace_info
+    save_cached_workspace_info(workspace_info)
     logger.info("TaskRouter setup complete.")
     return workspace_info
 
-def create_workspace(client):
-    """Creates or retrieves a TaskRouter Workspace, deleting existing ones with same name."""
-    existing_workspaces = client.taskrouter.workspaces.list(friendly_name=WORKSPACE_NAME)
-    for ws in existing_workspaces:
-        logger.info(f"Deleting existing workspace '{ws.friendly_name}' with SID: {ws.sid}")
-        try:
-            client.taskrouter.workspaces(ws.sid).delete()
-        except Exception as e:
-            logger.warning(f"Failed to delete workspace {ws.sid}: {e}. It might be in use or already deleted.")
-
-
+def create_workspace(client, force_rebuild=False):
+    """
+    Creates or reuses the TaskRouter Workspace, deleting any duplicates with the same name.
+    With force_rebuild, every existing workspace with the same name is deleted and a fresh one is created.
+    """
     events_callback = HOST + '/events' # Endpoint for TaskRouter events
-    logger.info(f"Creating new workspace '{WORKSPACE_NAME}' with event callback: {events_callback}")
+    existing_workspaces = client.taskrouter.workspaces.list(friendly_name=WORKSPACE_NAME)
+    if force_rebuild:
+        delete_resources(existing_workspaces, lambda sid: client.taskrouter.workspaces(sid).delete(), 'workspace')
+    elif existing_workspaces:
+        workspace = existing_workspaces[0]
+        delete_resources(existing_workspaces[1:], lambda sid: client.taskrouter.workspaces(sid).delete(), 'workspace')
+        if workspace.event_callback_url != events_callback:
+            logger.info("Updating workspace %s event callback to: %s", workspace.sid, events_callback)
+            workspace = client.taskrouter.workspaces(workspace.sid).update(event_callback_url=events_callback)
+        else:
+            logger.info("Reusing existing workspace '%s' with SID: %s", workspace.friendly_name, workspace.sid)
+        return workspace
+
+    logger.info("Creating new workspace '%s' with event callback: %s", WORKSPACE_NAME, events_callback)
     
     # template=None to ensure default activities are created
     return client.taskrouter.workspaces.create(
@@ -129,43 +274,36 @@ def create_workers(client, workspace, activities):
         raise ValueError("Agent numbers missing.")
 
     workers_sids = {}
-    
-    # Define workers and their attributes
-    worker_definitions = [
-        {'friendly_name': 'Alice', 'number': ALICE_NUMBER, 'products': ["ProgrammableVoice"], 'initial_activity': 'Available'},
-        {'friendly_name': 'Bob', 'number': BOB_NUMBER, 'products': ["ProgrammableSMS", "GeneralSupport"], 'initial_activity': 'Available'},
-        # LiveAgent_1 also maps to Alice's number, but has 'LiveAgent' and 'VoiceHandoff' skills
-        {'friendly_name': 'LiveAgent_1', 'number': ALICE_NUMBER, 'products': ["LiveAgent", "VoiceHandoff"], 'initial_activity': 'Available'}
-    ]
-
-    for worker_def in worker_definitions:
+
+    # One list call for all workers; same-named duplicates are removed in parallel
+    workers_api = client.taskrouter.workspaces(workspace.sid).workers
+    existing_workers, duplicates = index_existing(workers_api.list(), _WORKER_NAMES)
+    delete_resources(duplicates, lambda sid: workers_api(sid).delete(), 'worker')
+
+    for worker_def in _WORKER_DEFINITIONS:
         friendly_name = worker_def['friendly_name']
         number = worker_def['number']
-        products = worker_def['products']
+        attributes = worker_def['attributes']
         initial_activity = worker_def['initial_activity']
-        
-        # Check if worker already exists and delete if so, for idempotency
-        existing_workers = client.taskrouter.workspaces(workspace.sid).workers.list(friendly_name=friendly_name)
-        for w in existing_workers:
-            logger.info(f"Deleting existing worker '{w.friendly_name}' with SID: {w.sid}")
-            try:
-                client.taskrouter.workspaces(workspace.sid).workers(w.sid).delete()
-            except Exception as e:
-                logger.warning(f"Failed to delete worker {w.sid}: {e}. It might be in use or already deleted.")
 
+        # Reuse an existing worker, updating it only if its attributes changed; its current activity is left alone
+        worker = existing_workers.get(friendly_name)
+        if worker is not None:
+            if json.loads(worker.attributes) != attributes:
+                worker = workers_api(worker.sid).update(attributes=worker_def['attributes_json'])
+                logger.info("Updated worker '%s' (SID: %s) with attributes: %s", friendly_name, worker.sid, attributes)
+            else:
+                logger.info("Reusing worker '%s' (SID: %s)", friendly_name, worker.sid)
+            workers_sids[number] = worker.sid
+            continue
 
-        attributes = {
-            "products": products,
-            "contact_uri": number # The phone number TaskRouter will use to reach the worker
-        }
-        
         # Create the worker, set initial activity
-        worker = client.taskrouter.workspaces(workspace.sid).workers.create(
+        worker = workers_api.create(
             friendly_name=friendly_name,
-            attributes=json.dumps(attributes),
+            attributes=worker_def['attributes_json'],
             activity_sid=activities[initial_activity].sid
         )
-        logger.info(f"Created worker '{friendly_name}' (SID: {worker.sid}) with attributes: {attributes}")
+        logger.info("Created worker '%s' (SID: %s) with attributes: %s", friendly_name, worker.sid, attributes)
         workers_sids[number] = worker.sid # Store by phone number for easy lookup
 
     return workers_sids
@@ -173,62 +311,52 @@ def create_workers(client, workspace, activities):
 def create_task_queues(client, workspace, activities):
     """Creates or retrieves Task Queues."""
     queues_dict = {}
-    
-    queue_definitions = [
-        {'friendly_name': 'Default', 'target_workers': '1==1'},
-        {'friendly_name': 'SMS', 'target_workers': '"ProgrammableSMS" in products'},
-        {'friendly_name': 'Voice', 'target_workers': '"ProgrammableVoice" in products'},
-        {'friendly_name': 'LiveAgent_Handoff', 'target_workers': '"LiveAgent" in products AND "VoiceHandoff" in products'}, # For voice handoff
-    ]
-
-    for q_def in queue_definitions:
-        friendly_name = q_def['friendly_name']
-        target_workers_expression = q_def['target_workers']
 
-        # Check if queue already exists and delete if so
-        existing_queues = client.taskrouter.workspaces(workspace.sid).task_queues.list(friendly_name=friendly_name)
-        for q in existing_queues:
-            logger.info(f"Deleting existing Task Queue '{q.friendly_name}' with SID: {q.sid}")
-            try:
-                client.taskrouter.workspaces(workspace.sid).task_queues(q.sid).delete()
-            except Exception as e:
-                logger.warning(f"Failed to delete task queue {q.sid}: {e}. It might be in use or already deleted.")
+    queues_api = client.taskrouter.workspaces(workspace.sid).task_queues
+    existing_queues, duplicates = index_existing(queues_api.list(), _QUEUE_NAMES)
+    delete_resources(duplicates, lambda sid: queues_api(sid).delete(), 'Task Queue')
 
+    # assignment_activity_sid: The activity a worker will enter when assigned a task from this queue.
+    # 'Unavailable' is common for agents actively handling a task.
+    assignment_activity_sid = activities['Unavailable'].sid
 
-        # assignment_activity_sid: The activity a worker will enter when assigned a task from this queue.
-        # 'Unavailable' is common for agents actively handling a task.
-        queue = client.taskrouter.workspaces(workspace.sid).task_queues.create(
-            friendly_name=friendly_name,
-            assignment_activity_sid=activities['Unavailable'].sid,
-            target_workers=target_workers_expression
-        )
-        logger.info(f"Created Task Queue '{friendly_name}' (SID: {queue.sid}) with target_workers: '{target_workers_expression}'")
+    for q_def in _QUEUE_DEFINITIONS:
+        friendly_name = q_def['friendly_name']
+        target_workers_expression = q_def['target_workers']
+
+        queue = existing_queues.get(friendly_name)
+        if queue is None:
+            queue = queues_api.create(
+                friendly_name=friendly_name,
+                assignment_activity_sid=assignment_activity_sid,
+                target_workers=target_workers_expression
+            )
+            logger.info("Created Task Queue '%s' (SID: %s) with target_workers: '%s'", friendly_name, queue.sid, target_workers_expression)
+        elif queue.target_workers != target_workers_expression or queue.assignment_activity_sid != assignment_activity_sid:
+            queue = queues_api(queue.sid).update(
+                assignment_activity_sid=assignment_activity_sid,
+                target_workers=target_workers_expression
+            )
+            logger.info("Updated Task Queue '%s' (SID: %s) with target_workers: '%s'", friendly_name, queue.sid, target_workers_expression)
+        else:
+            logger.info("Reusing Task Queue '%s' (SID: %s)", friendly_name, queue.sid)
         queues_dict[friendly_name.lower().replace(" ", "_")] = queue # Use snake_case for dict keys
 
     return queues_dict
 
-def create_workflow(client, workspace, queues):
-    """Creates or retrieves the Workflow."""
-    
-    # Delete existing workflows with the same name for idempotency
-    existing_workflows = client.taskrouter.workspaces(workspace.sid).workflows.list(friendly_name='Sales')
-    for wf in existing_workflows:
-        logger.info(f"Deleting existing Workflow '{wf.friendly_name}' with SID: {wf.sid}")
-        try:
-            client.taskrouter.workspaces(workspace.sid).workflows(wf.sid).delete()
-        except Exception as e:
-            logger.warning(f"Failed to delete workflow {wf.sid}: {e}. It might be in use or already deleted.")
-
+@lru_cache(maxsize=8)
+def _build_workflow_config(default_queue_sid, handoff_queue_sid):
+    """Returns the workflow configuration JSON; only the queue SIDs vary, so each pair is serialized once."""
     # Define targets for filters
     default_target = {
-        'queue': queues['default'].sid,
+        'queue': default_queue_sid,
         'priority': 5,
         'timeout': 30
     }
 
     # Target for the LiveAgent_Handoff queue
     voice_handoff_target = {
-        'queue': queues['liveagent_handoff'].sid,
+        'queue': handoff_queue_sid,
         'priority': 1, # Higher priority for live agent requests
         'timeout': 60 # Longer timeout for agent to answer the bridged call
     }
@@ -247,25 +375,54 @@ def create_workflow(client, workspace, queues):
             'default_filter': default_target # Tasks that don't match any filter go here
         }
     }
+    return json.dumps(config)
+
+def create_workflow(client, workspace, queues):
+    """Creates or retrieves the Workflow."""
+    workflows_api = client.taskrouter.workspaces(workspace.sid).workflows
+    existing_workflows = workflows_api.list(friendly_name='Sales')
+    configuration = _build_workflow_config(queues['default'].sid, queues['liveagent_handoff'].sid)
 
     assignment_callback_url = HOST + '/assignment' # Your Flask endpoint for Task assignments
     fallback_assignment_callback_url = HOST + '/assignment' # Fallback if primary fails
 
-    logger.info(f"Creating Workflow 'Sales' with assignment callback: {assignment_callback_url}")
-    return client.taskrouter.workspaces(workspace.sid).workflows.create(
+    task_reservation_timeout = 20 # How long a task waits for a worker to accept
+
+    # Keep the first same-named workflow (updated only on drift) and delete the rest
+    if existing_workflows:
+        workflow = existing_workflows[0]
+        delete_resources(existing_workflows[1:], lambda sid: workflows_api(sid).delete(), 'Workflow')
+        if (json.loads(workflow.configuration) == json.loads(configuration)
+                and workflow.assignment_callback_url == assignment_callback_url
+                and workflow.fallback_assignment_callback_url == fallback_assignment_callback_url
+                and workflow.task_reservation_timeout == task_reservation_timeout):
+            logger.info("Reusing Workflow 'Sales' with SID: %s", workflow.sid)
+            return workflow
+        logger.info("Updating Workflow 'Sales' (%s) with assignment callback: %s", workflow.sid, assignment_callback_url)
+        return workflows_api(workflow.sid).update(
+            assignment_callback_url=assignment_callback_url,
+            fallback_assignment_callback_url=fallback_assignment_callback_url,
+            task_reservation_timeout=task_reservation_timeout,
+            configuration=configuration
+        )
+
+    logger.info("Creating Workflow 'Sales' with assignment callback: %s", assignment_callback_url)
+    return workflows_api.create(
         friendly_name='Sales', # Workflow name
         assignment_callback_url=assignment_callback_url,
         fallback_assignment_callback_url=fallback_assignment_callback_url,
-        task_reservation_timeout=20, # How long a task waits for a worker to accept
-        configuration=json.dumps(config)
+        task_reservation_timeout=task_reservation_timeout,
+        configuration=configuration
     )
 
 if __name__ == '__main__':
     # This block runs when taskrouter_setup.py is executed directly
+    from logging_setup import configure_logging
+    configure_logging()
     logger.info("Starting TaskRouter setup script...")
     try:
         twilio_client = build_client()
         setup(twilio_client)
         logger.info("TaskRouter setup script finished successfully.")
     except Exception as e:
-        logger.error(f"TaskRouter setup script failed: {e}", exc_info=True)
\ No newline at end of file
+        logger.error("TaskRouter setup script failed: %s", e, exc_info=True)
\ No newline at end of file
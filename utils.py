@@ -1,74 +1,144 @@
 # utils.py
 import os
-import random
-import string
+import re
+import hmac
+import hashlib
 from datetime import datetime, timedelta
 import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from twilio.rest import Client
-from database import db_session, OTP # Import OTP model and db_session from database.py
+from sqlalchemy import select, delete
+from database import db_session, OTP, DB_POOL_SIZE, DB_MAX_OVERFLOW # Import OTP model and db_session from database.py
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
+# Keys the OTP hashes so a leaked otps table can't be brute-forced over the 10^6 code space without it.
+# Unkeyed hashes are only allowed as an explicit local-development opt-in (OTP_ALLOW_UNKEYED_HASH=True).
+OTP_HASH_SECRET = os.getenv("OTP_HASH_SECRET", "").encode()
+if not OTP_HASH_SECRET:
+    if os.getenv("OTP_ALLOW_UNKEYED_HASH") != "True":
+        raise ValueError("OTP_HASH_SECRET environment variable not set. Please configure it in .env")
+    logger.warning("OTP_HASH_SECRET not set and OTP_ALLOW_UNKEYED_HASH=True; OTP hashes are unkeyed. Local development only.")
+
+# Runs OTP inserts alongside the Twilio SMS request in send_sms_otp; sized to the DB pool so a burst of
+# OTP requests is bounded by connections rather than executor slots (threads are greenlets under gevent)
+_OTP_STORE_EXECUTOR = ThreadPoolExecutor(max_workers=DB_POOL_SIZE + DB_MAX_OVERFLOW, thread_name_prefix='otp-store')
+
+# Moduli for OTP lengths 1-15; 64 random bits mod 10^15 keeps the bias below 2^-14, and below 2^-43 for 6 digits
+_POW10 = tuple(10 ** i for i in range(16))
+
 def generate_otp_code(length=6):
-    """Generates a random N-digit OTP code."""
-    return ''.join(random.choices(string.digits, k=length))
+    """Generates a random N-digit OTP code from one 8-byte read of the OS CSPRNG (random.choices is predictable)."""
+    return f"{int.from_bytes(os.urandom(8), 'little') % _POW10[length]:0{length}d}"
+
+@lru_cache(maxsize=1)
+def _twilio_client(account_sid, auth_token):
+    """Twilio REST Client reused across OTP sends, keeping its HTTP session (and TLS connection) warm."""
+    return Client(account_sid, auth_token)
+
+def hash_otp(phone_number, otp_code):
+    """Returns the hex HMAC-SHA256 stored for an OTP; binding the phone number keeps equal codes distinct."""
+    return hmac.new(OTP_HASH_SECRET, f"{phone_number}:{otp_code}".encode(), hashlib.sha256).hexdigest()
+
+def _store_otp(to_number, otp_code):
+    """Stores an OTP in the database with expiry and returns its id."""
+    with db_session() as session: # Use the context manager
+        # Opportunistically purge expired OTPs so the table stays at its small live set
+        session.execute(delete(OTP).where(OTP.expires_at < datetime.utcnow()))
+        expires_at = datetime.utcnow() + timedelta(minutes=5) # OTP valid for 5 minutes
+        new_otp = OTP(phone_number=to_number, otp_hash=hash_otp(to_number, otp_code), created_at=datetime.utcnow(), expires_at=expires_at)
+        session.add(new_otp)
+        session.flush()
+        # session.commit() is handled by db_session context manager
+        logger.info("OTP stored for %s, expires at %s", to_number, expires_at)
+        return new_otp.id
+
+def _discard_unsent_otp(store_future):
+    """Cancels a pending OTP insert, or deletes the row if it already ran, so an unsent code can't be verified."""
+    if store_future.cancel():
+        return
+    try:
+        otp_id = store_future.result()
+        with db_session() as session:
+            session.execute(delete(OTP).where(OTP.id == otp_id))
+    except Exception as e:
+        logger.error("Error discarding unsent OTP: %s", e, exc_info=True)
 
 def send_sms_otp(to_number, account_sid, auth_token, messaging_service_sid):
     """Sends an OTP SMS via Twilio."""
     try:
-        client = Client(account_sid, auth_token)
+        client = _twilio_client(account_sid, auth_token)
         otp_code = generate_otp_code()
-        
-        # Store OTP in database with expiry
-        with db_session() as session: # Use the context manager
-            expires_at = datetime.utcnow() + timedelta(minutes=5) # OTP valid for 5 minutes
-            new_otp = OTP(phone_number=to_number, otp_code=otp_code, created_at=datetime.utcnow(), expires_at=expires_at)
-            session.add(new_otp)
-            # session.commit() is handled by db_session context manager
-            logger.info(f"OTP {otp_code} stored for {to_number}, expires at {expires_at}")
-
-        message = client.messages.create(
-            messaging_service_sid=messaging_service_sid,
-            to=to_number,
-            body=f"Your OTP for financial bot is: {otp_code}. It is valid for 5 minutes. Do not share this with anyone."
-        )
-        logger.info(f"OTP sent to {to_number}: {message.sid}")
+
+        # The DB insert and the Twilio send don't depend on each other, so they run concurrently;
+        # success is only reported once both have completed
+        store_future = _OTP_STORE_EXECUTOR.submit(_store_otp, to_number, otp_code)
+
+        try:
+            message = client.messages.create(
+                messaging_service_sid=messaging_service_sid,
+                to=to_number,
+                body=f"Your OTP for financial bot is: {otp_code}. It is valid for 5 minutes. Do not share this with anyone."
+            )
+        except Exception:
+            _discard_unsent_otp(store_future)
+            raise
+        store_future.result()
+        logger.info("OTP sent to %s: %s", to_number, message.sid)
         return True
     except Exception as e:
-        logger.error(f"Error sending OTP to {to_number}: {e}", exc_info=True)
+        logger.error("Error sending OTP to %s: %s", to_number, e, exc_info=True)
         return False
 
 def verify_otp_code(phone_number, user_entered_otp):
-    """Verifies the user-entered OTP against the stored valid OTP."""
+    """Verifies the user-entered OTP against the stored valid OTP, consuming it on success."""
+    now = datetime.utcnow()
+    # Only the latest unexpired OTP for the phone counts, as before
+    latest_otp_id = select(OTP.id).where(
+        OTP.phone_number == phone_number,
+        OTP.expires_at > now
+    ).order_by(OTP.created_at.desc()).limit(1).scalar_subquery()
+
     with db_session() as session: # Use the context manager
-        # Get the latest OTP for the phone number that has not expired
-        latest_otp = session.query(OTP).filter(
-            OTP.phone_number == phone_number,
-            OTP.expires_at > datetime.utcnow()
-        ).order_by(OTP.created_at.desc()).first()
-
-        if latest_otp and latest_otp.otp_code == user_entered_otp:
-            # Optionally, delete or invalidate the OTP after successful verification
-            session.delete(latest_otp)
-            # session.commit() is handled by db_session context manager
-            logger.info(f"OTP {user_entered_otp} verified successfully for {phone_number}.")
-            return True
-        logger.warning(f"OTP verification failed for {phone_number}. Entered: {user_entered_otp}, Expected: {latest_otp.otp_code if latest_otp else 'None'} (or expired).")
-        return False
+        # Match and invalidate in one round-trip; a wrong code deletes nothing.
+        # Only hashes are compared, and in Postgres, so no Python-side comparison can leak timing.
+        verified = session.execute(
+            delete(OTP).where(OTP.id == latest_otp_id, OTP.otp_hash == hash_otp(phone_number, user_entered_otp)).returning(OTP.id)
+        ).first() is not None
+        # session.commit() is handled by db_session context manager
+
+    if verified:
+        logger.info("OTP verified successfully for %s.", phone_number)
+        return True
+    logger.warning("OTP verification failed for %s (incorrect or expired).", phone_number)
+    return False
 #commit
+# Spelled-out digits that speech-to-text may return instead of numerals ("one two three" -> "123")
+_SPOKEN_DIGITS = {
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+}
+_SPOKEN_DIGIT_RE = re.compile(r"\b(" + "|".join(_SPOKEN_DIGITS) + r")\b", re.IGNORECASE)
+# "oh" only counts as zero inside a digit sequence ("four oh two"), not as filler ("Oh, it's one two...")
+_OH_RUN_RE = re.compile(r"(?<=\d)((?:[\s,.-]*\boh\b)+)(?=[\s,.-]*\d)", re.IGNORECASE)
+_OH_RE = re.compile(r"\boh\b", re.IGNORECASE)
+_NON_DIGIT_RE = re.compile(r"[^0-9]+")
+
 def extract_digits_from_speech(speech_text):
     """
-    Extracts contiguous digits from a speech transcription.
+    Extracts digits from a speech transcription, including spelled-out digits.
     Useful for account IDs and OTPs.
     """
     if not speech_text:
         return ""
-    
-    # Simple approach: find the first sequence of digits
-    # For more robust parsing, consider LLM extraction or more complex regex
-    digits = ''.join(filter(str.isdigit, speech_text))
-    return digits
+
+    # One regex pass maps spoken digits to numerals, a second maps "oh"s sitting between digits,
+    # and a final (C-level) pass drops everything else
+    # For more robust parsing, consider LLM extraction
+    speech_text = _SPOKEN_DIGIT_RE.sub(lambda m: _SPOKEN_DIGITS[m.group(1).lower()], speech_text)
+    speech_text = _OH_RUN_RE.sub(lambda m: _OH_RE.sub("0", m.group(1)), speech_text)
+    return _NON_DIGIT_RE.sub("", speech_text)
 
 def hide_number(phone_number):
     """Hides parts of a phone number for privacy."""